@@ -34,37 +34,71 @@ Outputs:
 
 from __future__ import annotations
 import argparse
+import bisect
 import json
-import math
+import mmap
 import re
+import sys
 from pathlib import Path
 from collections import Counter, defaultdict
-from typing import Any, Dict, List
-
-
-TIME_RE = re.compile(r"(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})")
-TOKEN_RE = re.compile(r"[a-zàèéìòóù']+", re.IGNORECASE)
-
-DEFAULT_STOPWORDS_IT = {
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from heapq import nlargest
+from itertools import accumulate, islice
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+
+# SRT parsing runs on raw bytes (see parse_srt); only the cleaned subtitle text gets decoded.
+# Bytes-mode \s is ASCII only, so spell out the UTF-8 encodings of everything str-mode \s matches
+# (e.g. a "blank" line holding just a no-break space still separates entries).
+UTF8_WS = (
+    rb"(?:[\t-\r\x1c-\x20]|\xc2[\x85\xa0]|\xe1\x9a\x80|\xe2\x80[\x80-\x8a\xa8\xa9\xaf]"
+    rb"|\xe2\x81\x9f|\xe3\x80\x80)"
+)
+# One SRT entry: timestamp line, then everything up to the next blank line (or EOF).
+# Blank lines may be LF, CRLF or bare CR terminated.
+SRT_BLOCK_RE = re.compile(
+    rb"(\d{2}):(\d{2}):(\d{2}),(\d{3})" + UTF8_WS + rb"*-->" + UTF8_WS + rb"*(\d{2}):(\d{2}):(\d{2}),(\d{3})"
+    rb"[^\r\n]*(.*?)(?=\n" + UTF8_WS + rb"*\n|\r" + UTF8_WS + rb"*\r|\Z)",
+    re.DOTALL
+)
+# Token alphabet; matched against already lower-cased text (cheaper than IGNORECASE).
+TOKEN_CHARS = "a-zàèéìòóù'"
+# HTML-style tags, ASS override tags and [bracketed] captions, removed in one pass.
+CLEAN_RE = re.compile(rb"<[^>]+>|\{\\.*?\}|\[[^\]]+\]")
+LINE_BREAK_RE = re.compile(rb"[\r\n]")
+# Music notes count as whitespace so they collapse together with it.
+WS_RE = re.compile(r"[\s♪]+")
+
+DEFAULT_STOPWORDS_IT = frozenset(sys.intern(w) for w in {
     "che","e","di","a","da","in","un","una","il","lo","la","i","gli","le",
     "mi","ti","si","ci","vi","non","per","con","su","ma","o","ora","poi",
     "sono","sei","era","hai","ho","ha","abbiamo","avete","hanno","del","della","dei","delle",
     "al","allo","alla","ai","agli","alle","nel","nello","nella","nei","negli","nelle",
     "un'","l'","d'","c'","m'","t'","s'","e'","è"
-}
+})
 
-def t2s(time_string: str) -> float:
-    hh, mm, rest = time_string.split(":")
-    ss, ms = rest.split(",")
-    return int(hh) * 3600 + int(mm) * 60 + int(ss) + int(ms) / 1000.0
+def t2ms(hh: bytes, mm: bytes, ss: bytes, ms: bytes) -> int:
+    # Timestamps are kept as integer milliseconds internally; seconds only appear in the JSON.
+    return (int(hh) * 3600 + int(mm) * 60 + int(ss)) * 1000 + int(ms)
 
-def hms(seconds: float) -> str:
-    s = int(max(0, math.floor(seconds)))
+@lru_cache(maxsize=4096)
+def hms(seconds: int) -> str:
+    s = max(0, seconds)
     hh = s // 3600
     mm = (s % 3600) // 60
     ss = s % 60
     return f"{hh:02d}:{mm:02d}:{ss:02d}"
 
+def compile_token_re(min_word_length: int, stopwords: frozenset) -> re.Pattern:
+    # Emits only kept tokens: whole runs of TOKEN_CHARS, at least min_word_length long, not a stopword.
+    # Built once per run since both filters come from the CLI / caller.
+    c = f"[{TOKEN_CHARS}]"
+    long_stopwords = sorted((w for w in stopwords if len(w) >= min_word_length), key=len, reverse=True)
+    exclude = f"(?!(?:{'|'.join(map(re.escape, long_stopwords))})(?!{c}))" if long_stopwords else ""
+    return re.compile(f"(?<!{c}){exclude}{c}{{{max(1, min_word_length)},}}")
+
 def detect_repo_root(start_dir: Path) -> Path:
     current = start_dir.resolve()
     for _ in range(12):
@@ -85,88 +119,87 @@ def resolve_against_repo_root(path_value: str, repo_root: Path) -> Path:
         return p
     return (repo_root / p).resolve()
 
-def parse_srt(path: Path) -> List[Dict[str, Any]]:
-    text = path.read_text(encoding="utf-8", errors="replace")
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-    blocks = re.split(r"\n\s*\n", text.strip())
-
+def parse_srt(path: Path, max_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+    with path.open("rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Empty files (and some special files) cannot be mapped.
+            data = f.read()
+
+    try:
+        return parse_srt_bytes(data, max_ms)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+def parse_srt_bytes(data: Union[bytes, mmap.mmap], max_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+    # Entries starting at/after max_ms are dropped; SRTs are time-sorted, so stop at the first one.
     entries: List[Dict[str, Any]] = []
-    for block in blocks:
-        lines = [l.strip() for l in block.split("\n") if l.strip()]
-        if len(lines) < 2:
-            continue
-
-        if "-->" in lines[0]:
-            time_line = lines[0]
-            text_lines = lines[1:]
-        else:
-            time_line = lines[1] if len(lines) > 1 else ""
-            text_lines = lines[2:]
-
-        match = TIME_RE.search(time_line)
-        if not match:
-            continue
-
-        start = t2s(match.group(1))
-        end = t2s(match.group(2))
+    for match in SRT_BLOCK_RE.finditer(data):
+        start = t2ms(*match.group(1, 2, 3, 4))
+        if max_ms is not None and start >= max_ms:
+            break
+        end = t2ms(*match.group(5, 6, 7, 8))
 
-        subtitle = " ".join(text_lines)
-        subtitle = re.sub(r"<[^>]+>", "", subtitle)
-        subtitle = re.sub(r"\{\\.*?\}", "", subtitle)
-        subtitle = re.sub(r"\[[^\]]+\]", "", subtitle)
-        subtitle = subtitle.replace("♪", " ")
-        subtitle = re.sub(r"\s+", " ", subtitle).strip()
+        subtitle = CLEAN_RE.sub(b"", LINE_BREAK_RE.sub(b" ", match.group(9)))
+        subtitle = WS_RE.sub(" ", subtitle.decode("utf-8", errors="replace")).strip()
 
         if subtitle:
             entries.append({"start": start, "end": end, "text": subtitle})
     return entries
 
-def merge_adjacent_entries(entries: List[Dict[str, Any]], merge_gap_seconds: float) -> List[Dict[str, Any]]:
+def merge_adjacent_entries(entries: List[Dict[str, Any]], merge_gap_ms: int) -> List[Dict[str, Any]]:
     if not entries:
         return []
+    # Texts are already whitespace-collapsed by parse_srt, so each group is joined once at the end
+    # instead of re-concatenating (and re-stripping) the growing string per merged entry.
     merged: List[Dict[str, Any]] = []
-    current = dict(entries[0])
-    for nxt in entries[1:]:
-        gap = nxt["start"] - current["end"]
-        if gap <= merge_gap_seconds:
-            current["end"] = max(current["end"], nxt["end"])
-            current["text"] = (current["text"].rstrip() + " " + nxt["text"].lstrip()).strip()
+    first = entries[0]
+    start, end, texts = first["start"], first["end"], [first["text"]]
+    for nxt in islice(entries, 1, None):
+        # The gap is measured against the group's furthest end, not just the previous entry's.
+        if nxt["start"] - end <= merge_gap_ms:
+            if nxt["end"] > end:
+                end = nxt["end"]
+            texts.append(nxt["text"])
         else:
-            merged.append(current)
-            current = dict(nxt)
-    merged.append(current)
+            merged.append({"start": start, "end": end, "text": " ".join(texts)})
+            start, end, texts = nxt["start"], nxt["end"], [nxt["text"]]
+    merged.append({"start": start, "end": end, "text": " ".join(texts)})
     return merged
 
-def chapter_id(seconds: float, chapter_minutes: int) -> int:
-    return int(seconds // (chapter_minutes * 60)) + 1
-
 def collect_de_range_monotonic(
-    it_start: float,
-    it_end: float,
-    de_entries: List[Dict[str, Any]],
+    it_start: int,
+    it_end: int,
+    de_starts: List[int],
+    de_ends: List[int],
+    de_reach: List[int],
+    de_texts: List[str],
     start_index: int,
-    pad_seconds: float,
+    pad_ms: int,
     max_lines: int
 ) -> (str, int):
-    if not de_entries:
+    if not de_texts:
         return "", start_index
 
-    window_start = max(0.0, it_start - pad_seconds)
-    window_end = it_end + pad_seconds
+    window_start = max(0, it_start - pad_ms)
+    window_end = it_end + pad_ms
 
     texts: List[str] = []
-    i = start_index
-
-    while i < len(de_entries) and de_entries[i]["end"] < window_start:
-        i += 1
+    n = len(de_texts)
+    # SRTs are sorted by start only; a long line can outlast later, shorter ones, so ends may go
+    # backwards. de_reach (running max of de_ends) is sorted, and the first index whose reach
+    # hits the window is never past the first entry that actually overlaps it.
+    i = bisect.bisect_left(de_reach, window_start, start_index)
 
     j = i
-    while j < len(de_entries) and len(texts) < max_lines:
-        d = de_entries[j]
-        if d["start"] > window_end:
+    while j < n and len(texts) < max_lines:
+        if de_starts[j] > window_end:
             break
-        if d["end"] >= window_start and d["start"] <= window_end:
-            texts.append(d["text"])
+        # de_starts[j] <= window_end is guaranteed by the break above.
+        if de_ends[j] >= window_start:
+            texts.append(de_texts[j])
         j += 1
 
     next_index = max(start_index, j - 1 if j > start_index else start_index)
@@ -177,83 +210,98 @@ def collect_de_range_monotonic(
             compact.append(t)
     return " ".join(compact).strip(), next_index
 
-def build_phrase_cards(
-    it_entries: List[Dict[str, Any]],
-    de_entries: List[Dict[str, Any]],
-    chapter_minutes: int,
-    de_pad_seconds: float,
-    de_max_lines: int
-) -> List[Dict[str, Any]]:
-    cards: List[Dict[str, Any]] = []
-    de_index = 0
-    for idx, it in enumerate(it_entries):
-        de_text, de_index = collect_de_range_monotonic(
-            it["start"], it["end"], de_entries, de_index, de_pad_seconds, de_max_lines
-        )
-        cards.append({
-            "id": f"p_{idx+1:04d}",
-            "type": "phrase",
-            "chapterId": chapter_id(it["start"], chapter_minutes),
-            "start": it["start"],
-            "end": it["end"],
-            "timestamp": hms(it["start"]),
-            "it": it["text"],
-            "de": de_text,
-            "source": {"it": "srt", "de": "srt-range-monotonic"}
-        })
-    return cards
-
-def pick_best_de_gloss(examples: List[Dict[str, str]]) -> str:
-    # Best-effort: choose the most frequent DE context among examples.
+def pick_best_de_gloss(examples: List[Tuple[str, str, str]]) -> str:
+    # Best-effort: choose the most frequent DE context among (timestamp, it, de) examples.
     # If nothing exists, return empty.
-    de_texts = [ (ex.get("de") or "").strip() for ex in examples if (ex.get("de") or "").strip() ]
+    de_texts = [ de.strip() for _, _, de in examples if de.strip() ]
     if not de_texts:
         return ""
     counts = Counter(de_texts)
     best, _ = counts.most_common(1)[0]
     return best
 
-def build_word_cards(
+def build_cards(
     it_entries: List[Dict[str, Any]],
-    phrase_cards: List[Dict[str, Any]],
+    de_entries: List[Dict[str, Any]],
     chapter_minutes: int,
+    de_pad_ms: int,
+    de_max_lines: int,
     min_word_length: int,
     max_words_per_chapter: int,
-    stopwords_it: set,
+    stopwords_it: frozenset,
     max_examples_per_token: int = 2
-) -> List[Dict[str, Any]]:
-    chapter_token_counts = defaultdict(Counter)
-    chapter_examples = defaultdict(lambda: defaultdict(list))
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    # Phrase cards and word-token aggregation share a single pass over the IT entries.
+    # Parallel lists keep the per-IT-entry DE scan free of dict lookups.
+    de_starts = [d["start"] for d in de_entries]
+    de_ends = [d["end"] for d in de_entries]
+    de_reach = list(accumulate(de_ends, max))
+    de_texts = [d["text"] for d in de_entries]
+
+    chapter_ms = chapter_minutes * 60_000
+    token_re = compile_token_re(min_word_length, stopwords_it)
 
-    for it, phrase in zip(it_entries, phrase_cards):
-        ch = chapter_id(it["start"], chapter_minutes)
-        tokens = [t.lower().replace("’", "'") for t in TOKEN_RE.findall(it["text"])]
-        tokens = [t for t in tokens if len(t) >= min_word_length and t not in stopwords_it]
-        de_text = phrase.get("de", "")
+    phrases: List[Dict[str, Any]] = []
+    chapter_token_counts: Dict[int, Counter] = defaultdict(Counter)
+    chapter_examples: Dict[int, Dict[str, List[Tuple[str, str, str]]]] = {}
+
+    de_index = 0
+    for idx, it in enumerate(it_entries):
+        de_text, de_index = collect_de_range_monotonic(
+            it["start"], it["end"], de_starts, de_ends, de_reach, de_texts, de_index, de_pad_ms, de_max_lines
+        )
+        ch = it["start"] // chapter_ms + 1
+        ts = hms(it["start"] // 1000)
+        it_text = it["text"]
+
+        phrases.append({
+            "id": f"p_{idx+1:04d}",
+            "type": "phrase",
+            "chapterId": ch,
+            "start": it["start"] / 1000.0,
+            "end": it["end"] / 1000.0,
+            "timestamp": ts,
+            "it": it_text,
+            "de": de_text,
+            "source": {"it": "srt", "de": "srt-range-monotonic"}
+        })
 
+        tokens = token_re.findall(it_text.lower().replace("’", "'"))
+        token_counts = chapter_token_counts[ch]
+        token_examples = chapter_examples.setdefault(ch, {})
         for token in tokens:
-            chapter_token_counts[ch][token] += 1
-            ex_list = chapter_examples[ch][token]
+            token_counts[token] += 1
+            ex_list = token_examples.setdefault(token, [])
             if len(ex_list) < max_examples_per_token:
-                ex_list.append({"timestamp": hms(it["start"]), "it": it["text"], "de": de_text})
+                ex_list.append((ts, it_text, de_text))
 
-    cards: List[Dict[str, Any]] = []
+    words: List[Dict[str, Any]] = []
     for ch, counter in sorted(chapter_token_counts.items()):
-        for token, count in counter.most_common(max_words_per_chapter):
+        for token, count in nlargest(max_words_per_chapter, counter.items(), key=itemgetter(1)):
             examples = chapter_examples[ch][token]
             gloss = pick_best_de_gloss(examples)
-            cards.append({
+            words.append({
                 "id": f"w_c{ch}_{token}",
                 "type": "word",
                 "chapterId": ch,
                 "it": token,
                 "de": gloss,  # now non-empty in most cases (context gloss)
                 "freq": count,
-                "examples": examples,
+                "examples": [{"timestamp": t, "it": i, "de": d} for t, i, d in examples],
                 "wordInfo": {"pos": "", "lemma": "", "infinitive": ""},
                 "source": {"it": "srt-derived", "de": "de-context-gloss-from-srt"}
             })
-    return cards
+    return phrases, words
+
+def write_cards_json(path: Path, meta: Dict[str, Any], card_rows: List[str]) -> None:
+    # Same document as {"meta": meta, "cards": [...]}: meta stays indented, each card is one line.
+    meta_json = json.dumps(meta, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+    with path.open("w", encoding="utf-8") as f:
+        f.write('{\n  "meta": ' + meta_json + ',\n  "cards": [')
+        for i, row in enumerate(card_rows):
+            f.write(",\n    " if i else "\n    ")
+            f.write(row)
+        f.write("\n  ]\n}" if card_rows else "]\n}")
 
 def fail(message: str, exit_code: int = 2) -> int:
     print(f"[ERROR] {message}")
@@ -289,8 +337,9 @@ def main() -> int:
         return fail(f"DE SRT not found: {de_path}\nTip: run from repo root or pass an absolute path.")
 
     max_seconds = args.max_minutes * 60
-    merge_gap_seconds = max(0.0, args.merge_it_gap_ms / 1000.0)
-    de_pad_seconds = max(0.0, args.de_pad_ms / 1000.0)
+    max_ms = max_seconds * 1000
+    merge_gap_ms = max(0, args.merge_it_gap_ms)
+    de_pad_ms = max(0, args.de_pad_ms)
 
     print(f"[INFO] Repo root: {repo_root}")
     print(f"[INFO] IT: {it_path}")
@@ -298,14 +347,20 @@ def main() -> int:
     print(f"[INFO] OUT: {out_dir}")
     print(f"[INFO] Window: 00:00:00 - {hms(max_seconds)}")
 
-    it_entries = [e for e in parse_srt(it_path) if e["start"] < max_seconds]
-    de_entries = [e for e in parse_srt(de_path) if e["start"] < max_seconds]
+    # The two SRTs are independent; parse them side by side (file IO and regex scans overlap).
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        it_future = pool.submit(parse_srt, it_path, max_ms)
+        de_future = pool.submit(parse_srt, de_path, max_ms)
+        it_entries = it_future.result()
+        de_entries = de_future.result()
 
     if args.merge_it_adjacent:
-        it_entries = merge_adjacent_entries(it_entries, merge_gap_seconds)
+        it_entries = merge_adjacent_entries(it_entries, merge_gap_ms)
 
-    phrases = build_phrase_cards(it_entries, de_entries, args.chapter_minutes, de_pad_seconds, args.de_max_lines)
-    words = build_word_cards(it_entries, phrases, args.chapter_minutes, args.min_word_length, args.max_words_per_chapter, DEFAULT_STOPWORDS_IT)
+    phrases, words = build_cards(
+        it_entries, de_entries, args.chapter_minutes, de_pad_ms, args.de_max_lines,
+        args.min_word_length, args.max_words_per_chapter, DEFAULT_STOPWORDS_IT
+    )
 
     out_dir.mkdir(parents=True, exist_ok=True)
 
@@ -331,8 +386,8 @@ def main() -> int:
         ]
     }
 
-    (out_dir / "phrases.base.de.json").write_text(json.dumps({"meta": meta, "cards": phrases}, ensure_ascii=False, indent=2), encoding="utf-8")
-    (out_dir / "words.base.de.json").write_text(json.dumps({"meta": meta, "cards": words}, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_cards_json(out_dir / "phrases.base.de.json", meta, [json.dumps(c, ensure_ascii=False) for c in phrases])
+    write_cards_json(out_dir / "words.base.de.json", meta, [json.dumps(c, ensure_ascii=False) for c in words])
 
     print(f"[OK] Wrote {out_dir / 'phrases.base.de.json'}")
     print(f"[OK] Wrote {out_dir / 'words.base.de.json'}")